@@ -3,24 +3,86 @@ AI MCQ Generator Backend
 FastAPI server that extracts text from PDFs and generates MCQs using local Ollama
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from typing import List, Optional, Tuple
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import asyncio
+import hashlib
 import json
+import math
 import re
-import requests
+import time
+import httpx
 import io
 
-# PDF processing
+# JSON handling - prefer orjson (Rust-backed, several times faster on the
+# large arrays Ollama returns) for both parsing and response
+# serialization, fall back to stdlib json
 try:
-    import pdfplumber
-    PDF_LIBRARY = "pdfplumber"
+    import orjson
+    from fastapi.responses import ORJSONResponse as DefaultResponseClass
+    json_loads = orjson.loads
 except ImportError:
-    import PyPDF2
-    PDF_LIBRARY = "PyPDF2"
+    from fastapi.responses import JSONResponse as DefaultResponseClass
+    json_loads = json.loads
 
-app = FastAPI(title="AI MCQ Generator")
+# PDF processing - prefer PyMuPDF (5-20x faster extraction), fall back to
+# pdfplumber, then PyPDF2
+try:
+    import fitz  # PyMuPDF
+    PDF_LIBRARY = "PyMuPDF"
+except ImportError:
+    try:
+        import pdfplumber
+        PDF_LIBRARY = "pdfplumber"
+    except ImportError:
+        import PyPDF2
+        PDF_LIBRARY = "PyPDF2"
+
+async def _warm_ollama_model(app: FastAPI):
+    """Load the model before the first request and pin it in memory
+    (keep_alive=-1) so no user pays the multi-second cold load"""
+    try:
+        await app.state.http_client.post(
+            "/api/generate",
+            json={"model": OLLAMA_MODEL, "prompt": "", "keep_alive": OLLAMA_KEEP_ALIVE},
+        )
+    except httpx.HTTPError:
+        pass  # Ollama not up yet; the first real request warms it instead
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared HTTP client so Ollama calls reuse keep-alive connections
+    # instead of paying a TCP handshake per call
+    app.state.http_client = httpx.AsyncClient(
+        base_url=OLLAMA_BASE_URL,
+        timeout=httpx.Timeout(OLLAMA_TIMEOUT),
+        # Pool tracks the Ollama budget; 2x headroom covers embedding calls
+        limits=httpx.Limits(
+            max_keepalive_connections=OLLAMA_NUM_PARALLEL,
+            max_connections=OLLAMA_NUM_PARALLEL * 2,
+        ),
+    )
+    app.state.batcher = OllamaBatcher()
+    app.state.batcher.start()
+    app.state.response_cache = ResponseCache()
+    app.state.pdf_cache = {}  # file SHA-256 -> PDFResponse
+    # Warm in the background so startup is not blocked on model load
+    app.state.warmup_task = asyncio.create_task(_warm_ollama_model(app))
+    yield
+    app.state.warmup_task.cancel()
+    await app.state.batcher.stop()
+    await app.state.http_client.aclose()
+
+app = FastAPI(
+    title="AI MCQ Generator",
+    lifespan=lifespan,
+    default_response_class=DefaultResponseClass,
+)
 
 # Enable CORS for local development
 app.add_middleware(
@@ -40,25 +102,47 @@ OLLAMA_BASE_URL = "http://localhost:11434"
 OLLAMA_MODEL = "llama3.2"  # Change to your model: llama2, mistral, gemma, etc.
 OLLAMA_TEMPERATURE = 0.3  # Lower = more focused, Higher = more creative (0.0 - 1.0)
 OLLAMA_TIMEOUT = 120  # Request timeout in seconds
+OLLAMA_NUM_PARALLEL = 4  # Max concurrent Ollama requests (match Ollama's OLLAMA_NUM_PARALLEL)
+OLLAMA_KEEP_ALIVE = -1  # Keep the model resident (-1 = forever, or e.g. "30m")
+
+# Server
+UVICORN_WORKERS = 2  # Worker processes (each has its own pool, batcher, caches)
+# Split the Ollama budget across workers so the aggregate stays at
+# OLLAMA_NUM_PARALLEL regardless of worker count
+OLLAMA_PARALLEL_PER_WORKER = max(1, OLLAMA_NUM_PARALLEL // UVICORN_WORKERS)
+
+# Request Batching
+BATCH_MAX_SIZE = 8  # Max prompts flushed to Ollama per batch
+BATCH_MAX_DELAY = 0.1  # Seconds to wait for more prompts before flushing
+
+# Response Cache
+CACHE_TTL = 3600  # Seconds before a cached generation expires
+CACHE_MAX_ENTRIES = 256  # Oldest entries are evicted beyond this
+CACHE_SIMILARITY_THRESHOLD = 0.95  # Cosine similarity for near-duplicate prompts
+CACHE_MAX_TEMPERATURE = 0.4  # Skip caching above this (responses too variable)
+PDF_CACHE_MAX_ENTRIES = 32  # Extracted-text cache for repeated uploads
 
 # Text Processing
 MAX_CHUNK_SIZE = 2500  # Approximate tokens per chunk (1 token ≈ 4 chars)
 MAX_QUESTIONS_PER_CHUNK = 5  # Maximum questions to generate per chunk
+PDF_EXTRACT_WORKERS = 4  # Threads for per-page PDF extraction
+PDF_PARALLEL_MIN_PAGES = 8  # Below this, sequential extraction wins
 
 # ============================================================================
 # PROMPT TEMPLATE
 # ============================================================================
 
-OLLAMA_PROMPT = """You are an expert educator creating multiple-choice questions.
+# The static instructions come first and the variable fields go strictly at
+# the end, so Ollama's KV cache can reuse the shared prefix across calls
+# instead of re-prefilling the whole prompt every time.
 
-Given the following text, generate {n_questions} multiple-choice questions at {difficulty} difficulty level.
+STATIC_SYSTEM_PROMPT = """You are an expert educator creating multiple-choice questions.
 
-TEXT:
-{text}
+Generate multiple-choice questions from the text given at the end of this prompt.
 
 REQUIREMENTS:
-- Generate exactly {n_questions} questions
-- Difficulty: {difficulty}
+- Generate exactly the number of questions given by N_QUESTIONS below
+- Match the difficulty level given by DIFFICULTY below
 - Each question must have exactly 4 options (A, B, C, D)
 - One option must be correct
 - Include a brief explanation for the correct answer
@@ -66,16 +150,39 @@ REQUIREMENTS:
 OUTPUT FORMAT (CRITICAL - MUST BE VALID JSON):
 Return ONLY a JSON array with this exact structure, no other text:
 [
-  {{
+  {
     "question": "Question text here?",
     "options": ["Option A", "Option B", "Option C", "Option D"],
     "answer": 0,
     "explanation": "Brief explanation of why this is correct"
-  }}
+  }
 ]
 
 The "answer" field must be the zero-based index (0-3) of the correct option.
-Return ONLY the JSON array, no markdown, no code blocks, no additional text."""
+Return ONLY the JSON array, no markdown, no code blocks, no additional text.
+"""
+
+DYNAMIC_SUFFIX_HEADER = """
+N_QUESTIONS: {n_questions}
+DIFFICULTY: {difficulty}
+TEXT:
+"""
+
+@lru_cache(maxsize=32)
+def prompt_prefix(n_questions: int, difficulty: str) -> str:
+    """Static instructions plus the formatted non-text fields.
+
+    Only a handful of (count, difficulty) pairs ever occur, so each
+    prefix is formatted once and per-chunk prompt building reduces to a
+    single concatenation with the chunk text.
+    """
+    return STATIC_SYSTEM_PROMPT + DYNAMIC_SUFFIX_HEADER.format(
+        n_questions=n_questions, difficulty=difficulty
+    )
+
+# Rough token count of the static prefix (1 token ≈ 4 chars); passed as
+# num_keep to hint Ollama to retain the prefix in its KV cache
+STATIC_PROMPT_TOKENS = len(STATIC_SYSTEM_PROMPT) // 4
 
 # ============================================================================
 # MODELS
@@ -88,10 +195,14 @@ class MCQRequest(BaseModel):
 
 class MCQ(BaseModel):
     question: str
-    options: List[str]
-    answer: int
+    options: List[str] = Field(min_length=4, max_length=4)
+    answer: int = Field(ge=0, le=3)
     explanation: Optional[str] = None
 
+# Validates a whole response's worth of MCQs in one pass (pydantic-core
+# loops in Rust instead of Python)
+MCQ_LIST_ADAPTER = TypeAdapter(List[MCQ])
+
 class MCQResponse(BaseModel):
     mcqs: List[MCQ]
 
@@ -103,111 +214,420 @@ class PDFResponse(BaseModel):
 # HELPER FUNCTIONS
 # ============================================================================
 
-def extract_text_from_pdf(file_content: bytes) -> str:
-    """Extract text from PDF using available library"""
+def _extract_page_range(file_content: bytes, start: int, stop: int) -> str:
+    """Extract text from a contiguous page range.
+
+    PyMuPDF documents are not thread-safe, so each worker opens its own
+    document over the shared buffer.
+    """
+    with fitz.open(stream=file_content, filetype="pdf") as pdf:
+        return "".join(pdf[i].get_text() for i in range(start, stop))
+
+def extract_text_from_pdf(file_content: bytes) -> Tuple[str, int]:
+    """Extract text and the page count from PDF using available library"""
     try:
-        if PDF_LIBRARY == "pdfplumber":
+        if PDF_LIBRARY == "PyMuPDF":
+            with fitz.open(stream=file_content, filetype="pdf") as pdf:
+                page_count = pdf.page_count
+                if page_count < PDF_PARALLEL_MIN_PAGES:
+                    return "".join(page.get_text() for page in pdf).strip(), page_count
+            # Split the page range across threads; MuPDF releases the GIL
+            # during extraction so the workers genuinely overlap
+            workers = min(PDF_EXTRACT_WORKERS, page_count)
+            step = -(-page_count // workers)  # Ceiling division
+            ranges = [
+                (start, min(start + step, page_count))
+                for start in range(0, page_count, step)
+            ]
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                parts = pool.map(
+                    lambda r: _extract_page_range(file_content, *r), ranges
+                )
+            return "".join(parts).strip(), page_count
+        elif PDF_LIBRARY == "pdfplumber":
             with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    text += page.extract_text() or ""
-                return text.strip()
+                text = "".join(page.extract_text() or "" for page in pdf.pages)
+                return text.strip(), len(pdf.pages)
         else:  # PyPDF2
             pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() or ""
-            return text.strip()
+            text = "".join(page.extract_text() or "" for page in pdf_reader.pages)
+            return text.strip(), len(pdf_reader.pages)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"PDF extraction failed: {str(e)}")
 
 def chunk_text(text: str, max_size: int = MAX_CHUNK_SIZE) -> List[str]:
     """Split text into manageable chunks for processing"""
-    # Simple chunking by sentences/paragraphs
-    words = text.split()
+    # Walk the string once, cutting at the last whitespace before each
+    # limit, instead of materializing and re-joining every word
+    limit = max_size * 4  # Rough token estimate (1 token ≈ 4 chars)
+    length = len(text)
     chunks = []
-    current_chunk = []
-    current_size = 0
-    
-    for word in words:
-        word_size = len(word) + 1  # +1 for space
-        if current_size + word_size > max_size * 4:  # Rough token estimate
-            if current_chunk:
-                chunks.append(" ".join(current_chunk))
-                current_chunk = []
-                current_size = 0
-        current_chunk.append(word)
-        current_size += word_size
-    
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
-    
+    start = 0
+
+    while start < length:
+        end = start + limit
+        if end >= length:
+            chunk = text[start:].strip()
+            if chunk:
+                chunks.append(chunk)
+            break
+        cut = max(
+            text.rfind(" ", start, end),
+            text.rfind("\n", start, end),
+            text.rfind("\t", start, end),
+        )
+        if cut <= start:
+            # No break point in range; hard cut, keeping the character
+            cut = end
+            next_start = cut
+        else:
+            next_start = cut + 1  # Skip the whitespace we cut at
+        chunk = text[start:cut].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = next_start
+
     return chunks if chunks else [text]
 
-def call_ollama_generate(prompt: str) -> str:
+class _ArrayCompletionTracker:
+    """Track bracket depth across streamed fragments to detect when the
+    top-level JSON array closes, ignoring brackets inside strings."""
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, fragment: str) -> bool:
+        for char in fragment:
+            if self.escaped:
+                self.escaped = False
+                continue
+            if char == '\\':
+                self.escaped = self.in_string
+                continue
+            if char == '"':
+                self.in_string = not self.in_string
+                continue
+            if self.in_string:
+                continue
+            if char == '[':
+                self.depth += 1
+                self.started = True
+            elif char == ']':
+                self.depth -= 1
+                if self.started and self.depth <= 0:
+                    return True
+        return False
+
+async def call_ollama_generate(prompt: str) -> str:
     """Call Ollama API to generate text"""
     try:
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
+        async with app.state.http_client.stream(
+            "POST",
+            "/api/generate",
             json={
                 "model": OLLAMA_MODEL,
                 "prompt": prompt,
-                "stream": False,
+                "stream": True,
+                # Every call must restate keep_alive or Ollama resets the
+                # warm-up pin back to its 5-minute default
+                "keep_alive": OLLAMA_KEEP_ALIVE,
                 "options": {
                     "temperature": OLLAMA_TEMPERATURE,
+                    "num_keep": STATIC_PROMPT_TOKENS,
                 }
             },
-            timeout=OLLAMA_TIMEOUT
-        )
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Ollama API error: {response.status_code} - {response.text}"
-            )
-        
-        result = response.json()
-        return result.get("response", "")
-    
-    except requests.exceptions.ConnectionError:
+        ) as response:
+            if response.status_code != 200:
+                detail = (await response.aread()).decode(errors="replace")
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Ollama API error: {response.status_code} - {detail}"
+                )
+
+            # Accumulate streamed tokens; once the JSON array closes,
+            # stop reading so any trailing commentary is never generated
+            parts = []
+            tracker = _ArrayCompletionTracker()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                try:
+                    payload = json_loads(line)
+                except ValueError:
+                    continue
+                fragment = payload.get("response", "")
+                if fragment:
+                    parts.append(fragment)
+                    if tracker.feed(fragment):
+                        break
+                if payload.get("done"):
+                    break
+            return "".join(parts)
+
+    except httpx.ConnectError:
         raise HTTPException(
             status_code=503,
             detail="Cannot connect to Ollama. Make sure Ollama is running (ollama serve)"
         )
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         raise HTTPException(
             status_code=504,
             detail="Ollama request timed out. Try with shorter text or fewer questions."
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ollama error: {str(e)}")
 
+async def get_ollama_embedding(text: str) -> Optional[List[float]]:
+    """Fetch an embedding from Ollama; returns None on any failure"""
+    try:
+        response = await app.state.http_client.post(
+            "/api/embeddings",
+            json={"model": OLLAMA_MODEL, "prompt": text},
+        )
+        if response.status_code != 200:
+            return None
+        return response.json().get("embedding")
+    except httpx.HTTPError:
+        return None
+
+class ResponseCache:
+    """Two-tier in-process cache for Ollama generations.
+
+    Tier 1 is an exact lookup keyed on a hash of (model, temperature,
+    prompt). Tier 2 matches near-duplicate prompts by cosine similarity
+    of their Ollama embeddings, so regenerating from the same PDF (or a
+    lightly edited one) skips the multi-second generation entirely.
+    """
+
+    def __init__(self, ttl: int = CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._exact = {}  # key -> (expires_at, response)
+        self._vectors = []  # (key, n_questions, difficulty, embedding) for similarity lookups
+
+    @staticmethod
+    def key_for(prompt: str) -> str:
+        return hashlib.sha256(
+            f"{OLLAMA_MODEL}|{OLLAMA_TEMPERATURE}|{prompt}".encode()
+        ).hexdigest()
+
+    def get_exact(self, key: str) -> Optional[str]:
+        entry = self._exact.get(key)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if time.monotonic() > expires_at:
+            self._drop(key)
+            return None
+        return response
+
+    def _drop(self, key: str):
+        """Remove an entry and its vector so similarity scans never walk
+        dead keys"""
+        self._exact.pop(key, None)
+        self._vectors = [entry for entry in self._vectors if entry[0] != key]
+
+    def find_similar(
+        self, embedding: List[float], n_questions: int, difficulty: str
+    ) -> Optional[str]:
+        # Only entries generated with the same question count and
+        # difficulty are eligible; the embedding covers just the chunk
+        # text, so a near-duplicate chunk cached under other settings
+        # would silently return questions for the wrong settings
+        best_key = None
+        best_score = CACHE_SIMILARITY_THRESHOLD
+        for key, count, level, vector in self._vectors:
+            if count != n_questions or level != difficulty:
+                continue
+            score = _cosine_similarity(embedding, vector)
+            if score >= best_score:
+                best_key = key
+                best_score = score
+        if best_key is None:
+            return None
+        return self.get_exact(best_key)
+
+    def put(
+        self,
+        key: str,
+        response: str,
+        embedding: Optional[List[float]],
+        n_questions: int,
+        difficulty: str,
+    ):
+        if len(self._exact) >= self.max_entries:
+            self._drop(next(iter(self._exact)))
+        self._exact[key] = (time.monotonic() + self.ttl, response)
+        if embedding is not None:
+            self._vectors.append((key, n_questions, difficulty, embedding))
+
+def _cosine_similarity(a: List[float], b: List[float]) -> float:
+    if len(a) != len(b):
+        return 0.0
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+async def generate_with_cache(prompt: str, chunk: str, n_questions: int, difficulty: str) -> str:
+    """Generate via the batcher, short-circuiting on cache hits.
+
+    The similarity embedding covers only the chunk text: embedding the
+    full prompt would let the large shared prefix drag every pair toward
+    the threshold and match unrelated chunks.
+    """
+    if OLLAMA_TEMPERATURE > CACHE_MAX_TEMPERATURE:
+        return await app.state.batcher.submit(prompt)
+
+    cache = app.state.response_cache
+    key = ResponseCache.key_for(prompt)
+
+    cached = cache.get_exact(key)
+    if cached is not None:
+        return cached
+
+    embedding = await get_ollama_embedding(chunk)
+    if embedding is not None:
+        similar = cache.find_similar(embedding, n_questions, difficulty)
+        if similar is not None:
+            return similar
+
+    response = await app.state.batcher.submit(prompt)
+    # Only cache responses that yielded valid MCQs; replaying a bad
+    # generation for the full TTL would also defeat the retry path
+    if validate_mcq_list(extract_json_from_response(response)):
+        cache.put(key, response, embedding, n_questions, difficulty)
+    return response
+
+class OllamaBatcher:
+    """Coalesce prompts from concurrent requests into bounded batches.
+
+    Prompts arriving within BATCH_MAX_DELAY of each other are flushed to
+    Ollama together, amortizing model activation across queued work while
+    capping in-flight generation at OLLAMA_NUM_PARALLEL calls.
+    """
+
+    def __init__(self, max_batch_size: int = BATCH_MAX_SIZE, max_delay: float = BATCH_MAX_DELAY):
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._queue = asyncio.Queue()
+        self._semaphore = asyncio.Semaphore(OLLAMA_PARALLEL_PER_WORKER)
+        self._worker = None
+
+    def start(self):
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        # Fail anything still queued so shutdown never strands a caller
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(
+                    HTTPException(status_code=503, detail="Server shutting down")
+                )
+
+    async def submit(self, prompt: str) -> str:
+        """Queue a prompt and wait for its response"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((prompt, future))
+        return await future
+
+    async def _run(self):
+        # Single worker loop: all Ollama dispatch funnels through here,
+        # so batches are serialized and nothing else races the queue
+        loop = asyncio.get_running_loop()
+        while True:
+            # Block for the first prompt, then collect more until the
+            # batch is full or the delay window closes
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            except asyncio.CancelledError:
+                # stop() cancelled us mid-flush; fail the in-flight batch
+                # (stop() only drains the still-queued prompts) so
+                # submit() callers are never left hanging
+                self._fail_batch(
+                    batch, HTTPException(status_code=503, detail="Server shutting down")
+                )
+                raise
+            except Exception as e:
+                # A failed flush must not kill the worker; fail the batch
+                # and keep consuming the queue
+                self._fail_batch(batch, e)
+
+    @staticmethod
+    def _fail_batch(batch, exc: Exception):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(exc)
+
+    async def _flush(self, batch):
+        async def bounded_call(prompt: str) -> str:
+            async with self._semaphore:
+                return await call_ollama_generate(prompt)
+
+        responses = await asyncio.gather(
+            *[bounded_call(prompt) for prompt, _ in batch],
+            return_exceptions=True,
+        )
+        for (_, future), response in zip(batch, responses):
+            if future.done():
+                continue  # Caller went away (e.g. client disconnect)
+            if isinstance(response, Exception):
+                future.set_exception(response)
+            else:
+                future.set_result(response)
+
+# Precompiled patterns for pulling a JSON array out of an LLM response
+JSON_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*(\[.*?\])\s*```', re.DOTALL)
+JSON_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+
 def extract_json_from_response(response: str) -> List[dict]:
     """Extract and parse JSON from Ollama response"""
     # Try direct parse first
+    # (ValueError covers the decode errors of both orjson and stdlib json)
     try:
-        data = json.loads(response)
+        data = json_loads(response)
         if isinstance(data, list):
             return data
-    except json.JSONDecodeError:
+    except ValueError:
         pass
-    
+
     # Try to extract JSON array from markdown code blocks
-    json_match = re.search(r'```(?:json)?\s*(\[.*?\])\s*```', response, re.DOTALL)
+    json_match = JSON_CODE_BLOCK_RE.search(response)
     if json_match:
         try:
-            return json.loads(json_match.group(1))
-        except json.JSONDecodeError:
+            return json_loads(json_match.group(1))
+        except ValueError:
             pass
-    
+
     # Try to find JSON array in text
-    json_match = re.search(r'\[.*\]', response, re.DOTALL)
+    json_match = JSON_ARRAY_RE.search(response)
     if json_match:
         try:
-            return json.loads(json_match.group(0))
-        except json.JSONDecodeError:
+            return json_loads(json_match.group(0))
+        except ValueError:
             pass
-    
+
     return []
 
 def validate_mcq(mcq_dict: dict) -> Optional[MCQ]:
@@ -233,54 +653,72 @@ def validate_mcq(mcq_dict: dict) -> Optional[MCQ]:
     except Exception:
         return None
 
-def generate_mcqs_from_text(text: str, n_questions: int, difficulty: str) -> List[MCQ]:
+def validate_mcq_list(mcq_dicts: List[dict]) -> List[MCQ]:
+    """Validate a parsed response as one batch.
+
+    The TypeAdapter checks the whole list in a single call; if any entry
+    is malformed, fall back to per-item validation so good questions in
+    a partly bad response still survive.
+    """
+    try:
+        return MCQ_LIST_ADAPTER.validate_python(mcq_dicts)
+    except ValidationError:
+        mcqs = []
+        for mcq_dict in mcq_dicts:
+            mcq = validate_mcq(mcq_dict)
+            if mcq:
+                mcqs.append(mcq)
+        return mcqs
+
+async def generate_mcqs_from_text(text: str, n_questions: int, difficulty: str) -> List[MCQ]:
     """Generate MCQs from text using Ollama"""
-    chunks = chunk_text(text)
+    # Drop duplicate chunks (repeated pages, boilerplate) up front; they
+    # would only generate duplicate questions at full inference cost
+    chunks = list(dict.fromkeys(chunk_text(text)))
     all_mcqs = []
-    
+
     # Calculate questions per chunk
     questions_per_chunk = min(
         MAX_QUESTIONS_PER_CHUNK,
         max(1, n_questions // len(chunks))
     )
-    
-    for chunk_idx, chunk in enumerate(chunks):
-        # Adjust for last chunk to reach target
-        remaining = n_questions - len(all_mcqs)
+
+    # Build one (prompt, chunk, count) job per chunk up front
+    jobs = []
+    remaining = n_questions
+    for chunk in chunks:
         if remaining <= 0:
             break
-        
         chunk_questions = min(remaining, questions_per_chunk)
-        
-        # Generate prompt
-        prompt = OLLAMA_PROMPT.format(
-            n_questions=chunk_questions,
-            difficulty=difficulty,
-            text=chunk[:3000]  # Limit chunk size further for prompt
-        )
-        
-        # Call Ollama
-        response = call_ollama_generate(prompt)
-        
-        # Parse response
-        mcq_dicts = extract_json_from_response(response)
-        
-        # Validate and add MCQs
-        for mcq_dict in mcq_dicts:
-            mcq = validate_mcq(mcq_dict)
-            if mcq and len(all_mcqs) < n_questions:
+        chunk = chunk[:3000]  # Limit chunk size further for prompt
+        prompt = prompt_prefix(chunk_questions, difficulty) + chunk
+        jobs.append((prompt, chunk, chunk_questions))
+        remaining -= chunk_questions
+
+    # Dispatch all chunks through the cache + batcher; prompts from
+    # concurrent requests coalesce into bounded batches
+    responses = await asyncio.gather(
+        *[
+            generate_with_cache(prompt, chunk, count, difficulty)
+            for prompt, chunk, count in jobs
+        ]
+    )
+
+    # Parse and validate in arrival order
+    for response in responses:
+        for mcq in validate_mcq_list(extract_json_from_response(response)):
+            if len(all_mcqs) < n_questions:
                 all_mcqs.append(mcq)
-        
-        # If we didn't get valid MCQs, try one more time with explicit JSON instruction
-        if len(all_mcqs) == 0 and chunk_idx == 0:
-            retry_prompt = prompt + "\n\nIMPORTANT: Return ONLY valid JSON array, nothing else."
-            response = call_ollama_generate(retry_prompt)
-            mcq_dicts = extract_json_from_response(response)
-            for mcq_dict in mcq_dicts:
-                mcq = validate_mcq(mcq_dict)
-                if mcq and len(all_mcqs) < n_questions:
-                    all_mcqs.append(mcq)
-    
+
+    # If we didn't get valid MCQs, try one more time with explicit JSON instruction
+    if len(all_mcqs) == 0 and jobs:
+        first_prompt, first_chunk, first_count = jobs[0]
+        retry_prompt = first_prompt + "\n\nIMPORTANT: Return ONLY valid JSON array, nothing else."
+        response = await generate_with_cache(retry_prompt, first_chunk, first_count, difficulty)
+        for mcq in validate_mcq_list(extract_json_from_response(response)):
+            if len(all_mcqs) < n_questions:
+                all_mcqs.append(mcq)
+
     return all_mcqs
 
 # ============================================================================
@@ -298,26 +736,44 @@ async def root():
     }
 
 @app.post("/upload_pdf", response_model=PDFResponse)
-async def upload_pdf(file: UploadFile = File(...)):
+async def upload_pdf(request: Request, response: Response, file: UploadFile = File(...)):
     """
     Upload a PDF file and extract text
     """
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
-    
-    # Read file content
-    content = await file.read()
-    
-    # Extract text
-    text = extract_text_from_pdf(content)
-    
+
+    # Read the underlying SpooledTemporaryFile in one shot off the event
+    # loop; UploadFile's chunked async read would rebuild the buffer
+    # 64KB at a time with a thread hop per chunk
+    content = await asyncio.to_thread(file.file.read)
+
+    # Identical files skip extraction entirely: clients holding the ETag
+    # get a 304, and re-uploads hit the extracted-text cache
+    digest = hashlib.sha256(content).hexdigest()
+    etag = f'"{digest}"'
+    if request.headers.get("if-none-match") == etag:
+        # RFC 7232: a 304 should carry the ETag it was matched against
+        return Response(status_code=304, headers={"ETag": etag})
+
+    cached = app.state.pdf_cache.get(digest)
+    if cached is not None:
+        response.headers["ETag"] = etag
+        return cached
+
+    # Extract text in a worker thread; parsing large PDFs is CPU-bound
+    # and would otherwise stall the event loop
+    text, pages = await asyncio.to_thread(extract_text_from_pdf, content)
+
     if not text:
         raise HTTPException(status_code=400, detail="No text could be extracted from PDF")
-    
-    # Estimate page count (rough)
-    pages = len(content) // 2048  # Very rough estimate
-    
-    return PDFResponse(text=text, pages=max(1, pages))
+
+    result = PDFResponse(text=text, pages=max(1, pages))
+    if len(app.state.pdf_cache) >= PDF_CACHE_MAX_ENTRIES:
+        del app.state.pdf_cache[next(iter(app.state.pdf_cache))]
+    app.state.pdf_cache[digest] = result
+    response.headers["ETag"] = etag
+    return result
 
 @app.post("/generate_mcq", response_model=MCQResponse)
 async def generate_mcq(request: MCQRequest):
@@ -335,7 +791,7 @@ async def generate_mcq(request: MCQRequest):
         raise HTTPException(status_code=400, detail="Difficulty must be easy, medium, or hard")
     
     # Generate MCQs
-    mcqs = generate_mcqs_from_text(request.text, request.n_questions, request.difficulty)
+    mcqs = await generate_mcqs_from_text(request.text, request.n_questions, request.difficulty)
     
     if not mcqs:
         raise HTTPException(
@@ -348,5 +804,16 @@ async def generate_mcq(request: MCQRequest):
 if __name__ == "__main__":
     import uvicorn
     # Run with: python main.py
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Workers need the import-string form so each process builds its own
+    # app instance (client pool, batcher, and caches are per-worker).
+    # uvloop + httptools replace the stdlib event loop and HTTP parser;
+    # "auto" falls back gracefully where uvloop is unavailable (Windows)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=UVICORN_WORKERS,
+        loop="auto",
+        http="auto",
+    )
 